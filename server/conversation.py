@@ -2,56 +2,68 @@
 
 from __future__ import annotations
 
+from array import array
 from dataclasses import dataclass, field
 from collections import deque
+from functools import lru_cache
 import logging
 import time
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Final
 
 if TYPE_CHECKING:
     from memory_db import MemoryDB
-    from memory_manager import MemoryManager
+    from memory_manager import MemoryContext, MemoryManager
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+# Order of the raw IMU readings packed into SensorState.imu
+_IMU_KEYS = ("accel_x", "accel_y", "accel_z", "gyro_x", "gyro_y", "gyro_z")
+
+
+@dataclass(slots=True)
 class SensorState:
     """Current physical state of the M5Stack device."""
     orientation: str = "unknown"  # "face_up", "face_down", "tilted_left", etc.
     is_moving: bool = False
     is_shaking: bool = False
     last_tap: float = 0.0
-    accel_x: float = 0.0
-    accel_y: float = 0.0
-    accel_z: float = 0.0
-    gyro_x: float = 0.0
-    gyro_y: float = 0.0
-    gyro_z: float = 0.0
-    updated_at: float = 0.0
+    # accel_x, accel_y, accel_z, gyro_x, gyro_y, gyro_z (see _IMU_KEYS)
+    imu: array = field(default_factory=lambda: array("f", [0.0] * len(_IMU_KEYS)))
+    updated_at: float = 0.0  # time of the last sensor packet (for staleness)
 
     def summary(self) -> str:
         """Generate a human-readable summary of the physical state."""
         if self.updated_at == 0:
             return ""
 
-        age = time.time() - self.updated_at
-        if age > 30:
+        now = time.time()
+        if now - self.updated_at > 30:
             return ""
 
-        parts = [f"Device orientation: {self.orientation}"]
-        if self.is_shaking:
-            parts.append("The device is being shaken!")
-        elif self.is_moving:
-            parts.append("The device is being moved.")
+        return _format_sensor_summary(
+            self.orientation, self.is_moving, self.is_shaking, now - self.last_tap < 5
+        )
+
 
-        if time.time() - self.last_tap < 5:
-            parts.append("The device was just tapped.")
+@lru_cache(maxsize=64)
+def _format_sensor_summary(
+    orientation: str, is_moving: bool, is_shaking: bool, tapped: bool
+) -> str:
+    """Format the discrete sensor state. Memoized — the inputs take few distinct values."""
+    parts = [f"Device orientation: {orientation}"]
+    if is_shaking:
+        parts.append("The device is being shaken!")
+    elif is_moving:
+        parts.append("The device is being moved.")
 
-        return " ".join(parts)
+    if tapped:
+        parts.append("The device was just tapped.")
 
+    return " ".join(parts)
 
-SYSTEM_PROMPT = """\
+
+SYSTEM_PROMPT: Final[str] = """\
 You are Lo-Bug. You're a tiny voice assistant who lives on a desk. You have a mic and \
 a speaker — that's it. You can listen and talk. You cannot show images, open apps, \
 browse the web, display menus, or control anything. Just conversation.
@@ -86,6 +98,15 @@ talking to another person, or garbled fragments. Say nothing.
 Default to [IGNORE] for anything that isn't clearly directed at you. Better to stay \
 quiet than to butt in. Mumbling, partial sentences, and background noise get ignored."""
 
+# Message roles, shared by every message dict this module builds
+_SYSTEM: Final[str] = "system"
+_USER: Final[str] = "user"
+_ASSISTANT: Final[str] = "assistant"
+
+# The static prompt is always sent as its own first message, byte-for-byte identical
+# across turns, so Ollama's KV cache can reuse the prefill for it.
+_SYSTEM_MESSAGE: Final[dict] = {"role": _SYSTEM, "content": SYSTEM_PROMPT}
+
 
 class ConversationManager:
     """Manages rolling conversation history and sensor context."""
@@ -99,66 +120,107 @@ class ConversationManager:
         self.messages: deque[dict] = deque(maxlen=max_history)
         self.sensor_state = SensorState()
         self.memory_manager = memory_manager
+        self._last_user_content: str | None = None
+        # Memory context retrieved for the latest user message, reused within the turn
+        self._context: tuple[str, MemoryContext] | None = None
 
     def add_user_message(self, content: str) -> None:
-        self.messages.append({"role": "user", "content": content})
+        self.messages.append({"role": _USER, "content": content})
+        self._last_user_content = content
+        # Facts may have been extracted since the last turn; start retrieval fresh
+        self._context = None
 
     def add_assistant_message(self, content: str) -> None:
-        self.messages.append({"role": "assistant", "content": content})
+        self.messages.append({"role": _ASSISTANT, "content": content})
 
     def update_sensors(self, data: dict) -> None:
-        self.sensor_state.orientation = data.get("orientation", self.sensor_state.orientation)
-        self.sensor_state.is_moving = data.get("is_moving", False)
-        self.sensor_state.is_shaking = data.get("is_shaking", False)
-        if data.get("tap_detected", False):
-            self.sensor_state.last_tap = time.time()
-        self.sensor_state.accel_x = data.get("accel_x", 0.0)
-        self.sensor_state.accel_y = data.get("accel_y", 0.0)
-        self.sensor_state.accel_z = data.get("accel_z", 0.0)
-        self.sensor_state.gyro_x = data.get("gyro_x", 0.0)
-        self.sensor_state.gyro_y = data.get("gyro_y", 0.0)
-        self.sensor_state.gyro_z = data.get("gyro_z", 0.0)
-        self.sensor_state.updated_at = time.time()
+        """Apply a sensor packet.
+
+        updated_at moves on every packet so the 30 s staleness check tracks whether
+        the device is still reporting; the state fields are only rewritten when the
+        orientation, motion flags, or a tap change.
+        """
+        state = self.sensor_state
+        now = time.time()
+        state.updated_at = now
+        state.imu[:] = array("f", [data.get(k, 0.0) for k in _IMU_KEYS])
+
+        orientation = data.get("orientation", state.orientation)
+        is_moving = bool(data.get("is_moving", False))
+        is_shaking = bool(data.get("is_shaking", False))
+        tapped = bool(data.get("tap_detected", False))
+        if (not tapped
+                and orientation == state.orientation
+                and is_moving == state.is_moving
+                and is_shaking == state.is_shaking):
+            return
+
+        state.orientation = orientation
+        state.is_moving = is_moving
+        state.is_shaking = is_shaking
+        if tapped:
+            state.last_tap = now
 
     def build_messages(self) -> list[dict]:
-        """Build the full message list for the LLM, including system prompt and sensor context."""
-        system_content = SYSTEM_PROMPT
+        """Build the full message list for the LLM, including system prompt and sensor context.
+
+        The static SYSTEM_PROMPT goes first and is never modified; memory and sensor
+        context change from turn to turn, so they follow in a second system message.
+        """
+        context_parts: list[str] = []
 
         # Inject persistent memory context before sensor state
         if self.memory_manager:
-            last_user_msg = self._last_user_content()
+            last_user_msg = self._last_user_content
             if last_user_msg:
                 try:
-                    ctx = self.memory_manager.retrieve_context(last_user_msg)
+                    ctx = self._retrieve_context(last_user_msg)
                     if ctx.formatted:
-                        system_content += f"\n\n{ctx.formatted}"
+                        context_parts.append(ctx.formatted)
                 except Exception as e:
                     logger.warning("Memory retrieval error (non-fatal): %s", e)
 
         sensor_summary = self.sensor_state.summary()
         if sensor_summary:
-            system_content += f"\n\n[Current physical state: {sensor_summary}]"
+            context_parts.append(f"[Current physical state: {sensor_summary}]")
+
+        if context_parts:
+            context_msg = {"role": _SYSTEM, "content": "\n\n".join(context_parts)}
+            return [dict(_SYSTEM_MESSAGE), context_msg, *self.messages]
+        return [dict(_SYSTEM_MESSAGE), *self.messages]
 
-        messages = [{"role": "system", "content": system_content}]
-        messages.extend(self.messages)
-        return messages
+    def last_query_vec(self) -> list[float] | None:
+        """Embedding of the latest user message from this turn's memory retrieval, if any."""
+        if self._last_user_content is None:
+            return None
+        if self._context is None or self._context[0] != self._last_user_content:
+            return None
+        return self._context[1].query_vec
 
     def reload_from_db(self, db: MemoryDB) -> None:
         """Warm the deque from the database on startup."""
-        rows = db.get_recent_messages(self.max_history)
-        self.messages.clear()
-        for row in rows:
-            self.messages.append({"role": row.role, "content": row.content})
+        rows = db.get_recent_role_content(self.max_history)
+        self.messages = deque(
+            ({"role": role, "content": content} for role, content in rows),
+            maxlen=self.max_history,
+        )
+        self._last_user_content = next(
+            (m["content"] for m in reversed(self.messages) if m["role"] == _USER), None
+        )
         if rows:
             logger.info("Reloaded %d messages from DB into conversation deque", len(rows))
 
     def clear(self) -> None:
         self.messages.clear()
+        self._last_user_content = None
         self.sensor_state = SensorState()
+        self._context = None
+
+    def _retrieve_context(self, query: str) -> MemoryContext:
+        """Return memory context for the query, reusing it across rebuilds in one turn."""
+        if self._context is not None and self._context[0] == query:
+            return self._context[1]
 
-    def _last_user_content(self) -> str | None:
-        """Return the content of the most recent user message in the deque."""
-        for msg in reversed(self.messages):
-            if msg["role"] == "user":
-                return msg["content"]
-        return None
+        ctx = self.memory_manager.retrieve_context(query)
+        self._context = (query, ctx)
+        return ctx
@@ -1,7 +1,6 @@
 """Response decision logic: heuristic filtering and LLM response parsing."""
 
 import logging
-import re
 from enum import Enum
 
 from stt import TranscriptionResult
@@ -15,6 +14,13 @@ class Action(Enum):
     IGNORE = "ignore"
 
 
+# Response prefixes the LLM uses to pick a non-speaking action (see SYSTEM_PROMPT)
+_ACTION_PREFIXES: tuple[tuple[str, Action], ...] = (
+    ("[IGNORE]", Action.IGNORE),
+    ("[REACT]", Action.REACT),
+)
+
+
 # Exact-match hallucination blocklist (normalized: lowercase, stripped punctuation)
 HALLUCINATION_BLOCKLIST = frozenset({
     "thank you",
@@ -47,20 +53,32 @@ HALLUCINATION_BLOCKLIST = frozenset({
     "huh",
 })
 
-_PUNCT_RE = re.compile(r"[^\w\s]", re.UNICODE)
+class _NormalizeTable(dict):
+    """str.translate table that lowercases and drops everything but word chars and whitespace.
 
+    Equivalent to re.sub(r"[^\w\s]", "", text).lower(); each codepoint is classified
+    the first time it is seen and cached, so the table only holds characters that
+    actually occur in transcriptions.
+    """
 
-def _normalize(text: str) -> str:
-    """Lowercase and strip punctuation for blocklist comparison."""
-    return _PUNCT_RE.sub("", text.lower()).strip()
+    def __missing__(self, codepoint: int) -> str | None:
+        ch = chr(codepoint)
+        if ch.isalnum() or ch == "_":
+            value = ch.lower()
+        elif ch.isspace():
+            value = ch
+        else:
+            value = None
+        self[codepoint] = value
+        return value
 
 
-def _word_count(text: str) -> int:
-    """Count word tokens after stripping punctuation."""
-    cleaned = _PUNCT_RE.sub("", text).strip()
-    if not cleaned:
-        return 0
-    return len(cleaned.split())
+_NORMALIZE_TABLE = _NormalizeTable()
+
+
+def _normalize(text: str) -> str:
+    """Lowercase and strip punctuation in a single pass."""
+    return text.translate(_NORMALIZE_TABLE)
 
 
 def heuristic_filter(result: TranscriptionResult) -> str | None:
@@ -78,13 +96,16 @@ def heuristic_filter(result: TranscriptionResult) -> str | None:
         logger.info("Filtered: high avg no_speech_prob (%.2f)", result.avg_no_speech_prob)
         return "high_no_speech_prob"
 
+    # Normalize and split once; word count and blocklist lookup both reuse it
+    words = _normalize(result.text).split()
+
     # Too few words
-    if _word_count(result.text) < 2:
+    if len(words) < 2:
         logger.info("Filtered: too few words ('%s')", result.text)
         return "too_few_words"
 
-    # Hallucination blocklist
-    normalized = _normalize(result.text)
+    # Hallucination blocklist (normalized: lowercase, stripped punctuation, single spaces)
+    normalized = " ".join(words)
     if normalized in HALLUCINATION_BLOCKLIST:
         logger.info("Filtered: hallucination blocklist match ('%s' -> '%s')", result.text, normalized)
         return "hallucination_blocklist"
@@ -100,6 +121,21 @@ def heuristic_filter(result: TranscriptionResult) -> str | None:
     return None
 
 
+def detect_action(partial: str) -> Action | None:
+    """Decide the action from the start of a streamed LLM response.
+
+    Returns None while the text so far could still turn into an action prefix.
+    """
+    stripped = partial.lstrip()
+    undecided = False
+    for prefix, action in _ACTION_PREFIXES:
+        if stripped.startswith(prefix):
+            return action
+        if prefix.startswith(stripped):
+            undecided = True
+    return None if undecided else Action.RESPOND
+
+
 def parse_llm_response(raw: str) -> tuple[Action, str]:
     """Parse action prefix from LLM response text.
 
@@ -107,14 +143,10 @@ def parse_llm_response(raw: str) -> tuple[Action, str]:
     """
     stripped = raw.strip()
 
-    if stripped.startswith("[IGNORE]"):
-        cleaned = stripped[len("[IGNORE]"):].strip()
-        logger.info("LLM chose IGNORE: '%s'", cleaned)
-        return Action.IGNORE, cleaned
-
-    if stripped.startswith("[REACT]"):
-        cleaned = stripped[len("[REACT]"):].strip()
-        logger.info("LLM chose REACT: '%s'", cleaned)
-        return Action.REACT, cleaned
+    for prefix, action in _ACTION_PREFIXES:
+        if stripped.startswith(prefix):
+            cleaned = stripped[len(prefix):].strip()
+            logger.info("LLM chose %s: '%s'", action.name, cleaned)
+            return action, cleaned
 
     return Action.RESPOND, stripped
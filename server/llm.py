@@ -1,6 +1,13 @@
 """Ollama LLM integration."""
 
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
+from typing import Iterator, Protocol
+
+import httpx
+import numpy as np
 import ollama
 
 logger = logging.getLogger(__name__)
@@ -8,9 +15,43 @@ logger = logging.getLogger(__name__)
 DEFAULT_MODEL = "llama3.2:3b"
 DEFAULT_EMBEDDING_MODEL = "nomic-embed-text"
 
+FALLBACK_RESPONSE = "Sorry, I'm having trouble thinking right now."
+
 _model_name: str = DEFAULT_MODEL
 _embedding_model: str = DEFAULT_EMBEDDING_MODEL
 
+# Exact-match embedding cache: sha256(model, text) -> float32 vector, LRU-evicted.
+# Vectors are float32 (what sqlite-vec stores anyway), ~3 KB each at 768 dims.
+EMBED_CACHE_SIZE = 10000
+EMBED_CACHE_MAX_CHARS = 2000  # longer texts are embedded without caching
+_embed_cache: OrderedDict[bytes, np.ndarray] = OrderedDict()
+_embed_cache_lock = threading.Lock()
+
+
+class EmbeddingStore(Protocol):
+    """Persistent second tier for the embedding cache (implemented by MemoryDB)."""
+
+    def get_cached_embeddings(self, keys: list[bytes]) -> dict[bytes, bytes]: ...
+
+    def put_cached_embeddings(
+        self, items: list[tuple[bytes, bytes]], max_entries: int
+    ) -> None: ...
+
+
+_embed_store: EmbeddingStore | None = None
+
+# One client for every Ollama call, so requests reuse pooled keep-alive connections.
+# The read timeout bounds the wait between streamed chunks, not a whole reply.
+OLLAMA_TIMEOUT = httpx.Timeout(120.0, connect=5.0)
+OLLAMA_MAX_CONNECTIONS = 8
+_client = ollama.Client(
+    timeout=OLLAMA_TIMEOUT,
+    limits=httpx.Limits(
+        max_connections=OLLAMA_MAX_CONNECTIONS,
+        max_keepalive_connections=OLLAMA_MAX_CONNECTIONS,
+    ),
+)
+
 
 def configure(model: str = DEFAULT_MODEL) -> None:
     """Set which Ollama model to use."""
@@ -26,28 +67,92 @@ def configure_embeddings(model: str = DEFAULT_EMBEDDING_MODEL) -> None:
     logger.info("Embedding model configured: %s", _embedding_model)
 
 
+def configure_embedding_store(store: EmbeddingStore | None) -> None:
+    """Persist cached embeddings in store so they survive restarts."""
+    global _embed_store
+    _embed_store = store
+
+
+def _cache_key(text: str) -> bytes | None:
+    if len(text) > EMBED_CACHE_MAX_CHARS:
+        return None
+    return hashlib.sha256(f"{_embedding_model}\0{text}".encode()).digest()
+
+
+def _cache_put(key: bytes, vec: np.ndarray) -> None:
+    with _embed_cache_lock:
+        _embed_cache[key] = vec
+        if len(_embed_cache) > EMBED_CACHE_SIZE:
+            _embed_cache.popitem(last=False)
+
+
+def _embed_uncached(texts: str | list[str]) -> list[list[float]]:
+    response = _client.embed(model=_embedding_model, input=texts)
+    if isinstance(response, dict):
+        return response["embeddings"]
+    return response.embeddings
+
+
 def embed(text: str) -> list[float]:
     """Embed a single text string. Returns a float vector."""
-    response = ollama.embed(model=_embedding_model, input=text)
-    if isinstance(response, dict):
-        return response["embeddings"][0]
-    return response.embeddings[0]
+    return embed_batch([text])[0]
 
 
 def embed_batch(texts: list[str]) -> list[list[float]]:
-    """Embed multiple texts in one call. Returns a list of float vectors."""
+    """Embed multiple texts in one call. Returns a list of float vectors.
+
+    Texts are looked up in the in-memory cache, then the persistent store; only the
+    remaining misses go to Ollama, still in a single call.
+    """
     if not texts:
         return []
-    response = ollama.embed(model=_embedding_model, input=texts)
-    if isinstance(response, dict):
-        return response["embeddings"]
-    return response.embeddings
+    keys = [_cache_key(t) for t in texts]
+    results: list[list[float] | None] = [None] * len(texts)
+
+    with _embed_cache_lock:
+        for i, key in enumerate(keys):
+            vec = _embed_cache.get(key) if key is not None else None
+            if vec is not None:
+                _embed_cache.move_to_end(key)
+                results[i] = vec.tolist()
+    missing = [i for i, r in enumerate(results) if r is None]
+
+    stored_keys = [keys[i] for i in missing if keys[i] is not None]
+    if stored_keys and _embed_store is not None:
+        try:
+            stored = _embed_store.get_cached_embeddings(stored_keys)
+        except Exception as e:
+            logger.warning("Embedding store lookup failed (non-fatal): %s", e)
+            stored = {}
+        for i in missing:
+            blob = stored.get(keys[i])
+            if blob is not None:
+                vec = np.frombuffer(blob, dtype=np.float32)
+                _cache_put(keys[i], vec)
+                results[i] = vec.tolist()
+        missing = [i for i in missing if results[i] is None]
+
+    if missing:
+        new_entries: list[tuple[bytes, bytes]] = []
+        vecs = _embed_uncached([texts[i] for i in missing])
+        for i, vec in zip(missing, vecs):
+            results[i] = vec
+            if keys[i] is not None:
+                arr = np.asarray(vec, dtype=np.float32)
+                _cache_put(keys[i], arr)
+                new_entries.append((keys[i], arr.tobytes()))
+        if new_entries and _embed_store is not None:
+            try:
+                _embed_store.put_cached_embeddings(new_entries, EMBED_CACHE_SIZE)
+            except Exception as e:
+                logger.warning("Embedding store write failed (non-fatal): %s", e)
+    return results
 
 
 def check_available() -> bool:
     """Check if Ollama is running and the model is available."""
     try:
-        result = ollama.list()
+        result = _client.list()
         # Handle both old (.models) and new (dict) API styles
         if hasattr(result, 'models'):
             models_list = result.models
@@ -70,6 +175,76 @@ def check_available() -> bool:
         return False
 
 
+def warmup(system_prompt: str) -> None:
+    """Prime Ollama's KV cache with the system prompt in a background thread.
+
+    Sends one request that generates a single token, so the first real turn finds
+    the system-prompt prefill already cached. Failures are logged and ignored.
+    """
+    def _prime() -> None:
+        try:
+            _client.chat(
+                model=_model_name,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": "hi"},
+                ],
+                options={"num_predict": 1},
+            )
+            logger.info("LLM prefix cache warmed (%d-char system prompt)", len(system_prompt))
+        except Exception as e:
+            logger.warning("LLM warmup failed (non-fatal): %s", e)
+
+    threading.Thread(target=_prime, name="llm-warmup", daemon=True).start()
+
+
+class ChatStream:
+    """Iterable of content chunks from one streamed Ollama reply.
+
+    `complete` becomes True only once Ollama has finished the reply. It stays False
+    if the stream fails, so callers can tell a truncated reply (or the fallback
+    apology) from a whole one.
+    """
+
+    def __init__(self, messages: list[dict]):
+        self.messages = messages
+        self.complete = False
+
+    def __iter__(self) -> Iterator[str]:
+        produced = False
+        try:
+            for part in _client.chat(model=_model_name, messages=self.messages, stream=True):
+                # Handle both old (.message.content) and new (dict) API
+                if hasattr(part, 'message'):
+                    chunk = part.message.content or ""
+                elif isinstance(part, dict):
+                    chunk = part.get('message', {}).get('content', '')
+                else:
+                    chunk = str(part)
+                if chunk:
+                    produced = True
+                    yield chunk
+        except Exception as e:
+            logger.error("LLM error: %s", e)
+            if not produced:
+                yield FALLBACK_RESPONSE
+            return
+        self.complete = True
+
+
+def chat_stream(messages: list[dict]) -> ChatStream:
+    """Stream a response from Ollama, yielding content chunks as they are generated.
+
+    Args:
+        messages: List of message dicts with 'role' and 'content' keys.
+
+    Returns:
+        A ChatStream over pieces of the assistant's response text. If Ollama fails
+        before producing anything, a single fallback apology is yielded instead.
+    """
+    return ChatStream(messages)
+
+
 def chat(messages: list[dict]) -> str:
     """Send messages to Ollama and get a response.
 
@@ -79,17 +254,6 @@ def chat(messages: list[dict]) -> str:
     Returns:
         The assistant's response text.
     """
-    try:
-        response = ollama.chat(model=_model_name, messages=messages)
-        # Handle both old (.message.content) and new (dict) API
-        if hasattr(response, 'message'):
-            text = response.message.content.strip()
-        elif isinstance(response, dict):
-            text = response.get('message', {}).get('content', '').strip()
-        else:
-            text = str(response).strip()
-        logger.info("LLM response (%d chars): %s...", len(text), text[:80])
-        return text
-    except Exception as e:
-        logger.error("LLM error: %s", e)
-        return "Sorry, I'm having trouble thinking right now."
+    text = "".join(chat_stream(messages)).strip()
+    logger.info("LLM response (%d chars): %s...", len(text), text[:80])
+    return text
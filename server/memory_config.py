@@ -28,3 +28,11 @@ class MemoryConfig:
 
     # Duplicate detection: cosine distance below which a new fact replaces the old
     duplicate_distance_threshold: float = 0.15
+
+    # Fact extraction: exchanges with fewer words (user + assistant) are skipped
+    fact_min_words: int = 6
+
+    # Response cache: reuse a reply for a near-identical query in the same context
+    response_cache_enabled: bool = True
+    response_cache_min_similarity: float = 0.95  # cosine similarity floor for a hit
+    response_cache_ttl: float = 600.0  # seconds; keeps time-sensitive replies fresh
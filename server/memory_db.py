@@ -1,9 +1,13 @@
 """SQLite + sqlite-vec database layer for persistent memory."""
 
 import logging
-import struct
+import threading
 import time
+from contextlib import contextmanager
 from dataclasses import dataclass
+from typing import Iterator
+
+import numpy as np
 
 try:
     import pysqlite3 as sqlite3  # has enable_load_extension support
@@ -45,9 +49,57 @@ class SummaryRow:
     created_at: float
 
 
-def serialize_vector(vec: list[float]) -> bytes:
-    """Pack a float list into bytes for sqlite-vec."""
-    return struct.pack(f"{len(vec)}f", *vec)
+# Hot-path statements, kept in one place so each call hits the connection's statement cache
+_SQL_INSERT_MESSAGE = (
+    "INSERT INTO conversation_log (role, content, created_at) VALUES (?, ?, ?)"
+)
+_SQL_COUNT_UNSUMMARIZED = "SELECT COUNT(*) FROM conversation_log WHERE summarized = 0"
+_SQL_CASCADE_COUNTERS = (
+    "SELECT (SELECT COUNT(*) FROM conversation_log WHERE summarized = 0), "
+    "(SELECT COUNT(*) FROM memory_summaries WHERE incorporated = 0)"
+)
+_SQL_INSERT_FACT = (
+    "INSERT INTO memory_facts (embedding, content, source, fact_type, created_at) "
+    "VALUES (vec_int8(?), ?, ?, ?, ?)"
+)
+_SQL_SEARCH_FACTS = (
+    "SELECT id, distance, content, source, fact_type, created_at "
+    "FROM memory_facts WHERE embedding MATCH vec_int8(?) AND k = ?"
+)
+# Drops the nearest fact if it is within the distance threshold (upsert_fact)
+_SQL_DELETE_NEAR_DUPLICATE = (
+    "DELETE FROM memory_facts WHERE id IN ("
+    "SELECT id FROM (SELECT id, distance FROM memory_facts "
+    "WHERE embedding MATCH vec_int8(?) AND k = 1) WHERE distance < ?)"
+)
+_SQL_SEARCH_FACT_CONTENT = (
+    "SELECT content FROM (SELECT distance, content FROM memory_facts "
+    "WHERE embedding MATCH vec_int8(?) AND k = ?) "
+    "WHERE distance <= ? ORDER BY distance"
+)
+
+# Prepared statements kept per connection (sqlite3 default is 128)
+_STATEMENT_CACHE_SIZE = 256
+
+# Element type of memory_facts.embedding, recorded in memory_meta
+FACT_VECTOR_ENCODING = "int8"
+
+
+def serialize_vector(vec: list[float] | np.ndarray) -> bytes:
+    """Pack a float vector into float32 bytes for sqlite-vec. float32 arrays pass through."""
+    return np.asarray(vec, dtype=np.float32).tobytes()
+
+
+def quantize_vector(vec: list[float] | np.ndarray) -> bytes:
+    """Pack a float vector into int8 bytes for the memory_facts column.
+
+    Each vector is scaled so its largest component maps to ±127. Cosine distance
+    ignores the scale, so this only costs rounding error (~1e-3 in distance).
+    """
+    arr = np.asarray(vec, dtype=np.float32)
+    peak = float(np.abs(arr).max(initial=0.0))
+    scale = 127.0 / peak if peak else 0.0
+    return np.rint(arr * scale).astype(np.int8).tobytes()
 
 
 class MemoryDB:
@@ -56,11 +108,25 @@ class MemoryDB:
     def __init__(self, config: MemoryConfig | None = None):
         self.config = config or MemoryConfig()
         self.conn: sqlite3.Connection | None = None
+        self._lock = threading.RLock()
+        self._tx_depth = 0
+        # (content, source, fact_type, created_at) of facts embedded with a different
+        # model; memory_facts keeps them until replace_facts() swaps in new vectors
+        self.stale_facts: list[tuple[str, str, str, float]] = []
 
     def initialize(self) -> None:
         """Open the database, load sqlite-vec, create tables, enable WAL."""
-        self.conn = sqlite3.connect(self.config.db_path, check_same_thread=False)
+        self.conn = sqlite3.connect(
+            self.config.db_path,
+            check_same_thread=False,
+            cached_statements=_STATEMENT_CACHE_SIZE,
+        )
         self.conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is durable with WAL (only the last commits can be lost on power failure)
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA mmap_size=268435456")
+        self.conn.execute("PRAGMA cache_size=-20000")
 
         # Load sqlite-vec extension
         import sqlite_vec
@@ -69,6 +135,7 @@ class MemoryDB:
         self.conn.enable_load_extension(False)
 
         self._create_tables()
+        self._check_embedding_model()
         logger.info("Memory DB initialized at %s", self.config.db_path)
 
     def _create_tables(self) -> None:
@@ -84,19 +151,14 @@ class MemoryDB:
                 summarized INTEGER NOT NULL DEFAULT 0
             )
         """)
+        # Cascade checks scan for summarized = 0 in id order
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_conv_summarized
+            ON conversation_log (summarized, id)
+        """)
 
         # Facts with vector embeddings (sqlite-vec virtual table)
-        dim = self.config.embedding_dim
-        cur.execute(f"""
-            CREATE VIRTUAL TABLE IF NOT EXISTS memory_facts USING vec0 (
-                id INTEGER PRIMARY KEY,
-                embedding float[{dim}] distance_metric=cosine,
-                +content TEXT,
-                +source TEXT,
-                +fact_type TEXT,
-                +created_at FLOAT
-            )
-        """)
+        self._create_facts_table(cur)
 
         # Conversation summaries
         cur.execute("""
@@ -109,6 +171,10 @@ class MemoryDB:
                 incorporated INTEGER NOT NULL DEFAULT 0
             )
         """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sum_incorporated
+            ON memory_summaries (incorporated, id)
+        """)
 
         # Base memory — single row
         cur.execute("""
@@ -125,17 +191,170 @@ class MemoryDB:
             VALUES (1, '', ?)
         """, (time.time(),))
 
+        # Persistent embedding cache for llm.embed: sha256(model, text) -> float32 bytes,
+        # trimmed least-recently-used first
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                key BLOB PRIMARY KEY,
+                vec BLOB NOT NULL,
+                last_used REAL NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        """)
+        columns = {row[1] for row in cur.execute("PRAGMA table_info(embedding_cache)")}
+        if "last_used" not in columns:
+            cur.execute(
+                "ALTER TABLE embedding_cache ADD COLUMN last_used REAL NOT NULL DEFAULT 0"
+            )
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_embedding_cache_used
+            ON embedding_cache (last_used)
+        """)
+
+        # Key/value metadata (embedding model the stored vectors came from)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS memory_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+
         self.conn.commit()
 
+    def _create_facts_table(self, cur: sqlite3.Cursor) -> None:
+        dim = self.config.embedding_dim
+        cur.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS memory_facts USING vec0 (
+                id INTEGER PRIMARY KEY,
+                embedding {FACT_VECTOR_ENCODING}[{dim}] distance_metric=cosine,
+                +content TEXT,
+                +source TEXT,
+                +fact_type TEXT,
+                +created_at FLOAT
+            )
+        """)
+
+    def _embedding_format(self) -> dict[str, str]:
+        """The embedding model/dim/encoding new vectors are written with."""
+        return {
+            "embedding_model": self.config.embedding_model,
+            "embedding_dim": str(self.config.embedding_dim),
+            "embedding_encoding": FACT_VECTOR_ENCODING,
+        }
+
+    def _write_embedding_format(self, conn: sqlite3.Connection) -> None:
+        conn.executemany(
+            "INSERT OR REPLACE INTO memory_meta (key, value) VALUES (?, ?)",
+            self._embedding_format().items(),
+        )
+
+    def _check_embedding_model(self) -> None:
+        """Compare the stored embedding model/dim/encoding with the config.
+
+        Vectors from a different model are not comparable with new queries. On a
+        mismatch the old facts are listed in stale_facts, but memory_facts and
+        memory_meta are left untouched until MemoryManager.reembed_stale_facts()
+        hands the new vectors to replace_facts(), so a failed or interrupted
+        re-embed is retried on the next start instead of losing the facts.
+        """
+        current = self._embedding_format()
+        stored = dict(self.conn.execute(
+            "SELECT key, value FROM memory_meta WHERE key IN (?, ?, ?)", tuple(current)
+        ).fetchall())
+
+        # Databases created before memory_meta existed are assumed to match the
+        # model; ones created before the encoding was recorded hold float32 vectors
+        stored.setdefault("embedding_model", current["embedding_model"])
+        stored.setdefault("embedding_dim", current["embedding_dim"])
+        if "embedding_encoding" not in stored:
+            ddl = self.conn.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'memory_facts'"
+            ).fetchone()[0]
+            stored["embedding_encoding"] = (
+                FACT_VECTOR_ENCODING if f"{FACT_VECTOR_ENCODING}[" in ddl else "float32"
+            )
+
+        if stored == current:
+            with self.transaction() as conn:
+                self._write_embedding_format(conn)
+            return
+
+        # Same model, older float32 storage: the vectors only need re-encoding
+        if (stored["embedding_model"] == current["embedding_model"]
+                and stored["embedding_dim"] == current["embedding_dim"]
+                and stored["embedding_encoding"] == "float32"):
+            self._quantize_facts()
+            return
+
+        logger.warning(
+            "Embedding format changed (%s/%s/%s -> %s/%s/%s); facts need re-embedding",
+            stored["embedding_model"], stored["embedding_dim"],
+            stored["embedding_encoding"], current["embedding_model"],
+            current["embedding_dim"], current["embedding_encoding"],
+        )
+        self.stale_facts = self.conn.execute(
+            "SELECT content, source, fact_type, created_at FROM memory_facts"
+        ).fetchall()
+
+    def _quantize_facts(self) -> None:
+        """Re-encode a float32 memory_facts table as int8, without re-embedding."""
+        rows = self.conn.execute(
+            "SELECT content, embedding, source, fact_type, created_at FROM memory_facts"
+        ).fetchall()
+        self.replace_facts([
+            (content, np.frombuffer(blob, dtype=np.float32), source, fact_type, created_at)
+            for content, blob, source, fact_type, created_at in rows
+        ])
+        logger.info("Converted %d fact embeddings from float32 to int8", len(rows))
+
+    def replace_facts(
+        self, facts: list[tuple[str, list[float], str, str, float]]
+    ) -> None:
+        """Atomically rebuild memory_facts from re-embedded facts.
+
+        facts are (content, embedding, source, fact_type, created_at) rows. The
+        current embedding format is recorded in the same transaction. The old table is only dropped inside the same transaction that fills the new
+        one, so a failure leaves the previous facts and metadata in place.
+        """
+        with self.transaction() as conn:
+            # DDL does not open a transaction implicitly; start one explicitly
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DROP TABLE memory_facts")
+            self._create_facts_table(conn.cursor())
+            conn.executemany(_SQL_INSERT_FACT, [
+                (quantize_vector(vec), content, source, fact_type, created_at)
+                for content, vec, source, fact_type, created_at in facts
+            ])
+            self._write_embedding_format(conn)
+        self.stale_facts = []
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Group writes into a single commit.
+
+        Every mutator runs inside one of these, so a lone call commits on its own
+        while a batch wrapped in an outer transaction() commits (and fsyncs) once.
+        Nested calls join the outermost transaction.
+        """
+        with self._lock:
+            self._tx_depth += 1
+            try:
+                yield self.conn
+            except BaseException:
+                self._tx_depth -= 1
+                if self._tx_depth == 0:
+                    self.conn.rollback()
+                raise
+            self._tx_depth -= 1
+            if self._tx_depth == 0:
+                self.conn.commit()
+
     # --- Conversation log ---
 
     def append_message(self, role: str, content: str) -> int:
         """Insert a message into conversation_log. Returns its row id."""
-        cur = self.conn.execute(
-            "INSERT INTO conversation_log (role, content, created_at) VALUES (?, ?, ?)",
-            (role, content, time.time()),
-        )
-        self.conn.commit()
+        with self.transaction() as conn:
+            cur = conn.execute(_SQL_INSERT_MESSAGE, (role, content, time.time()))
         return cur.lastrowid
 
     def get_recent_messages(self, n: int) -> list[MessageRow]:
@@ -147,10 +366,17 @@ class MemoryDB:
         ).fetchall()
         return [MessageRow(*r) for r in reversed(rows)]
 
+    def get_recent_role_content(self, n: int) -> list[tuple[str, str]]:
+        """Return (role, content) of the last n messages (oldest first), as raw tuples."""
+        rows = self.conn.execute(
+            "SELECT role, content FROM conversation_log ORDER BY id DESC LIMIT ?",
+            (n,),
+        ).fetchall()
+        rows.reverse()
+        return rows
+
     def count_unsummarized(self) -> int:
-        row = self.conn.execute(
-            "SELECT COUNT(*) FROM conversation_log WHERE summarized = 0"
-        ).fetchone()
+        row = self.conn.execute(_SQL_COUNT_UNSUMMARIZED).fetchone()
         return row[0]
 
     def get_unsummarized_messages(self) -> list[MessageRow]:
@@ -163,35 +389,61 @@ class MemoryDB:
 
     def mark_summarized(self, up_to_id: int) -> None:
         """Mark all messages up to (inclusive) the given id as summarized."""
-        self.conn.execute(
-            "UPDATE conversation_log SET summarized = 1 WHERE id <= ?",
-            (up_to_id,),
-        )
-        self.conn.commit()
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE conversation_log SET summarized = 1 WHERE id <= ?",
+                (up_to_id,),
+            )
 
     # --- Facts (vector store) ---
 
     def insert_fact(
-        self, content: str, embedding: list[float], source: str, fact_type: str
+        self,
+        content: str,
+        embedding: list[float],
+        source: str,
+        fact_type: str,
+        created_at: float | None = None,
     ) -> int:
-        """Insert a fact with its embedding vector. Returns the row id."""
-        vec_bytes = serialize_vector(embedding)
-        cur = self.conn.execute(
-            "INSERT INTO memory_facts (embedding, content, source, fact_type, created_at) "
-            "VALUES (?, ?, ?, ?, ?)",
-            (vec_bytes, content, source, fact_type, time.time()),
-        )
-        self.conn.commit()
+        """Insert a fact with its embedding vector (stored as int8). Returns the row id."""
+        vec_bytes = quantize_vector(embedding)
+        if created_at is None:
+            created_at = time.time()
+        with self.transaction() as conn:
+            cur = conn.execute(
+                _SQL_INSERT_FACT, (vec_bytes, content, source, fact_type, created_at)
+            )
+        return cur.lastrowid
+
+    def upsert_fact(
+        self,
+        content: str,
+        embedding: list[float],
+        threshold: float,
+        source: str,
+        fact_type: str,
+    ) -> int:
+        """Insert a fact, replacing the nearest existing one if it is a near-duplicate.
+
+        A fact within `threshold` cosine distance is deleted in the same transaction,
+        without a round trip through Python. Returns the new row id.
+        """
+        vec_bytes = quantize_vector(embedding)
+        with self.transaction() as conn:
+            replaced = conn.execute(
+                _SQL_DELETE_NEAR_DUPLICATE, (vec_bytes, threshold)
+            ).rowcount
+            cur = conn.execute(
+                _SQL_INSERT_FACT, (vec_bytes, content, source, fact_type, time.time())
+            )
+        if replaced > 0:
+            logger.debug("Replaced near-duplicate fact with '%s'", content)
         return cur.lastrowid
 
     def search_facts(self, query_embedding: list[float], k: int) -> list[FactRow]:
         """KNN search over memory_facts. Returns up to k results sorted by distance."""
-        vec_bytes = serialize_vector(query_embedding)
-        rows = self.conn.execute(
-            "SELECT id, distance, content, source, fact_type, created_at "
-            "FROM memory_facts WHERE embedding MATCH ? AND k = ?",
-            (vec_bytes, k),
-        ).fetchall()
+        vec_bytes = quantize_vector(query_embedding)
+        rows = self.conn.execute(_SQL_SEARCH_FACTS, (vec_bytes, k)).fetchall()
         return [
             FactRow(
                 id=r[0], distance=r[1], content=r[2],
@@ -200,22 +452,73 @@ class MemoryDB:
             for r in rows
         ]
 
+    def search_fact_contents(
+        self, query_embedding: list[float], k: int, max_distance: float = 2.0
+    ) -> list[str]:
+        """KNN search returning only the contents within max_distance, nearest first.
+
+        For prompt retrieval: the distance cut-off is applied in SQL, and the
+        auxiliary columns and FactRow construction are skipped; use search_facts()
+        when ids or metadata are needed.
+        """
+        vec_bytes = quantize_vector(query_embedding)
+        rows = self.conn.execute(
+            _SQL_SEARCH_FACT_CONTENT, (vec_bytes, k, max_distance)
+        ).fetchall()
+        return [row[0] for row in rows]
+
     def delete_fact(self, fact_id: int) -> None:
         """Delete a fact by id."""
-        self.conn.execute("DELETE FROM memory_facts WHERE id = ?", (fact_id,))
-        self.conn.commit()
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM memory_facts WHERE id = ?", (fact_id,))
+
+    # --- Embedding cache ---
+
+    def get_cached_embeddings(self, keys: list[bytes]) -> dict[bytes, bytes]:
+        """Return {key: float32 vector bytes} for the keys present in embedding_cache.
+
+        Hits are marked as used, so trimming evicts them last.
+        """
+        placeholders = ",".join("?" * len(keys))
+        rows = self.conn.execute(
+            f"SELECT key, vec FROM embedding_cache WHERE key IN ({placeholders})",
+            keys,
+        ).fetchall()
+        if rows:
+            with self.transaction() as conn:
+                conn.executemany(
+                    "UPDATE embedding_cache SET last_used = ? WHERE key = ?",
+                    [(time.time(), key) for key, _ in rows],
+                )
+        return dict(rows)
+
+    def put_cached_embeddings(
+        self, items: list[tuple[bytes, bytes]], max_entries: int
+    ) -> None:
+        """Store (key, float32 vector bytes) pairs, keeping the max_entries most recently used."""
+        now = time.time()
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (key, vec, last_used) VALUES (?, ?, ?)",
+                [(key, vec, now) for key, vec in items],
+            )
+            conn.execute(
+                "DELETE FROM embedding_cache WHERE key IN ("
+                "SELECT key FROM embedding_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (max_entries,),
+            )
 
     # --- Summaries ---
 
     def insert_summary(
         self, content: str, source_from_id: int, source_to_id: int
     ) -> int:
-        cur = self.conn.execute(
-            "INSERT INTO memory_summaries (content, source_from_id, source_to_id, created_at) "
-            "VALUES (?, ?, ?, ?)",
-            (content, source_from_id, source_to_id, time.time()),
-        )
-        self.conn.commit()
+        with self.transaction() as conn:
+            cur = conn.execute(
+                "INSERT INTO memory_summaries (content, source_from_id, source_to_id, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (content, source_from_id, source_to_id, time.time()),
+            )
         return cur.lastrowid
 
     def count_unincorporated_summaries(self) -> int:
@@ -224,6 +527,10 @@ class MemoryDB:
         ).fetchone()
         return row[0]
 
+    def cascade_counters(self) -> tuple[int, int]:
+        """Return (unsummarized messages, unincorporated summaries) in one query."""
+        return self.conn.execute(_SQL_CASCADE_COUNTERS).fetchone()
+
     def get_unincorporated_summaries(self) -> list[SummaryRow]:
         rows = self.conn.execute(
             "SELECT id, content, source_from_id, source_to_id, created_at "
@@ -232,11 +539,11 @@ class MemoryDB:
         return [SummaryRow(*r) for r in rows]
 
     def mark_incorporated(self, up_to_id: int) -> None:
-        self.conn.execute(
-            "UPDATE memory_summaries SET incorporated = 1 WHERE id <= ?",
-            (up_to_id,),
-        )
-        self.conn.commit()
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE memory_summaries SET incorporated = 1 WHERE id <= ?",
+                (up_to_id,),
+            )
 
     # --- Base memory ---
 
@@ -247,8 +554,8 @@ class MemoryDB:
         return row[0] if row else ""
 
     def set_base_memory(self, content: str) -> None:
-        self.conn.execute(
-            "UPDATE memory_base SET content = ?, updated_at = ? WHERE id = 1",
-            (content, time.time()),
-        )
-        self.conn.commit()
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE memory_base SET content = ?, updated_at = ? WHERE id = 1",
+                (content, time.time()),
+            )
@@ -2,19 +2,39 @@
 
 import json
 import logging
+import re
 from dataclasses import dataclass, field
 from typing import Callable
 
+import orjson
+
 from memory_config import MemoryConfig
 from memory_db import MemoryDB
 from memory_prompts import (
     distill_base_memory_messages,
-    fact_extraction_messages,
+    fact_extraction_batch_messages,
     summarize_conversation_messages,
 )
 
 logger = logging.getLogger(__name__)
 
+# Broad query used to pull facts into the long-term cascade
+_GENERIC_FACTS_QUERY = "user information and preferences"
+
+# Markdown code fence wrapped around the whole reply, e.g. ```json ... ```
+_FENCE_RE = re.compile(r"^```[a-z]*\n|\n?```$")
+# Whitespace and separators between array items
+_ITEM_SEP_RE = re.compile(r"[\s,]*")
+_JSON_DECODER = json.JSONDecoder()
+
+# User turns that are pure acknowledgement or small talk; never worth an extraction call
+_FILLER_RE = re.compile(
+    r"(?:ok(?:ay)?|sure|cool|nice|great|yes|yeah|yep|no|nope|got it|sounds good|"
+    r"thanks?(?: you)?(?: so much)?|hi|hello|hey|bye|good ?night|good morning|"
+    r"never ?mind|lol|haha|hmm)[\s.,!?]*",
+    re.IGNORECASE,
+)
+
 
 @dataclass
 class MemoryContext:
@@ -22,12 +42,15 @@ class MemoryContext:
     base_memory: str
     relevant_facts: list[str]
     formatted: str  # ready-to-inject text block
+    query_vec: list[float] | None = None  # embedding of the query, if it succeeded
 
 
 class MemoryManager:
     """Orchestrates retrieval, extraction, and cascade operations.
 
     Accepts embed_fn and chat_fn as callables so it is fully LLM-backend-agnostic.
+    embed_batch_fn embeds several texts in one backend call; without it, texts are
+    embedded one at a time with embed_fn.
     """
 
     def __init__(
@@ -36,11 +59,39 @@ class MemoryManager:
         embed_fn: Callable[[str], list[float]],
         chat_fn: Callable[[list[dict]], str],
         config: MemoryConfig | None = None,
+        embed_batch_fn: Callable[[list[str]], list[list[float]]] | None = None,
     ):
         self.db = db
         self.embed_fn = embed_fn
         self.chat_fn = chat_fn
         self.config = config or db.config
+        self.embed_batch_fn = embed_batch_fn or (lambda texts: [embed_fn(t) for t in texts])
+        self._generic_query_vec: list[float] | None = None  # embedded on first use
+        # (base_memory, facts) -> formatted block from the previous retrieval
+        self._last_format: tuple[tuple[str, tuple[str, ...]], str] | None = None
+
+    def reembed_stale_facts(self) -> None:
+        """Re-embed facts stored under a different embedding model and swap them in.
+
+        On failure the old facts stay in the database and are retried on the next start.
+        """
+        stale = self.db.stale_facts
+        if not stale:
+            return
+
+        try:
+            vecs = self.embed_batch_fn([content for content, *_ in stale])
+        except Exception as e:
+            logger.error(
+                "Re-embedding %d facts failed, will retry on next start: %s", len(stale), e
+            )
+            return
+
+        self.db.replace_facts([
+            (content, vec, source, fact_type, created_at)
+            for (content, source, fact_type, created_at), vec in zip(stale, vecs)
+        ])
+        logger.info("Re-embedded %d facts with the new embedding model", len(stale))
 
     # ------------------------------------------------------------------
     # Retrieval (synchronous, called before LLM response)
@@ -50,16 +101,17 @@ class MemoryManager:
         """Embed the query, KNN-search facts, fetch base memory, return formatted context."""
         base_memory = self.db.get_base_memory()
         relevant_facts: list[str] = []
+        query_vec: list[float] | None = None
 
         try:
             query_vec = self.embed_fn(query)
-            results = self.db.search_facts(query_vec, k=self.config.retrieval_top_k)
             # cosine distance: 0 = identical, 2 = opposite
             # similarity = 1 - distance; keep facts above min_similarity
-            max_distance = 1.0 - self.config.retrieval_min_similarity
-            relevant_facts = [
-                r.content for r in results if r.distance <= max_distance
-            ]
+            relevant_facts = self.db.search_fact_contents(
+                query_vec,
+                k=self.config.retrieval_top_k,
+                max_distance=1.0 - self.config.retrieval_min_similarity,
+            )
         except Exception as e:
             logger.warning("Memory retrieval failed (non-fatal): %s", e)
 
@@ -68,18 +120,28 @@ class MemoryManager:
             base_memory=base_memory,
             relevant_facts=relevant_facts,
             formatted=formatted,
+            query_vec=query_vec,
         )
 
-    @staticmethod
-    def _format_context(base_memory: str, facts: list[str]) -> str:
-        """Build the text block that gets injected into the system prompt."""
+    def _format_context(self, base_memory: str, facts: list[str]) -> str:
+        """Build the text block that gets injected into the system prompt.
+
+        Consecutive retrievals usually return the same base memory and facts, so the
+        last block is reused when its inputs match.
+        """
+        key = (base_memory, tuple(facts))
+        if self._last_format is not None and self._last_format[0] == key:
+            return self._last_format[1]
+
         parts: list[str] = []
         if base_memory:
             parts.append(f"[Long-term memory]\n{base_memory}")
         if facts:
             bullet_list = "\n".join(f"- {f}" for f in facts)
             parts.append(f"[Relevant memories]\n{bullet_list}")
-        return "\n\n".join(parts)
+        formatted = "\n\n".join(parts)
+        self._last_format = (key, formatted)
+        return formatted
 
     # ------------------------------------------------------------------
     # Background processing (called after response is sent)
@@ -87,79 +149,131 @@ class MemoryManager:
 
     def process_exchange(self, user_text: str, assistant_text: str) -> None:
         """Extract facts and run cascade checks. Safe to call in a background task."""
+        self.process_exchanges([(user_text, assistant_text)])
+
+    def process_exchanges(self, exchanges: list[tuple[str, str]]) -> None:
+        """Like process_exchange, but for several queued exchanges at once.
+
+        Facts are extracted with one LLM call for the whole batch, and the cascade
+        checks run once, off a single read of both counters.
+        """
         try:
-            self._extract_facts(user_text, assistant_text)
+            self._extract_facts(exchanges)
         except Exception as e:
             logger.error("Fact extraction failed (non-fatal): %s", e)
 
         try:
-            self._check_short_term_cascade()
+            unsummarized, unincorporated = self.db.cascade_counters()
+        except Exception as e:
+            logger.error("Reading cascade counters failed (non-fatal): %s", e)
+            return
+        if (unsummarized < self.config.short_term_threshold
+                and unincorporated < self.config.long_term_threshold):
+            return
+
+        try:
+            if self._check_short_term_cascade(unsummarized):
+                unincorporated += 1
         except Exception as e:
             logger.error("Short-term cascade failed (non-fatal): %s", e)
 
         try:
-            self._check_long_term_cascade()
+            self._check_long_term_cascade(unincorporated)
         except Exception as e:
             logger.error("Long-term cascade failed (non-fatal): %s", e)
 
     # --- Fact extraction ---
 
-    def _extract_facts(self, user_text: str, assistant_text: str) -> None:
-        messages = fact_extraction_messages(user_text, assistant_text)
+    def _worth_extracting(self, user_text: str, assistant_text: str) -> bool:
+        """Cheap pre-check so greetings and acknowledgements skip the extraction call."""
+        if _FILLER_RE.fullmatch(user_text.strip()):
+            return False
+        words = len(user_text.split()) + len(assistant_text.split())
+        return words >= self.config.fact_min_words
+
+    def _extract_facts(self, exchanges: list[tuple[str, str]]) -> None:
+        exchanges = [ex for ex in exchanges if self._worth_extracting(*ex)]
+        if not exchanges:
+            logger.debug("Skipped fact extraction: only filler exchanges")
+            return
+
+        messages = fact_extraction_batch_messages(exchanges)
         raw = self.chat_fn(messages)
 
         facts = self._parse_facts_json(raw)
         if not facts:
             return
 
+        fact_texts: list[str] = []
+        fact_types: list[str] = []
         for item in facts:
             fact_text = item.get("fact", "").strip()
-            fact_type = item.get("type", "knowledge")
             if not fact_text:
                 continue
+            fact_texts.append(fact_text)
+            fact_types.append(item.get("type", "knowledge"))
 
-            vec = self.embed_fn(fact_text)
-            self._deduplicate_and_insert(fact_text, vec, fact_type)
+        if not fact_texts:
+            return
+
+        # One embedding call for all facts, then write them in one commit
+        vecs = self.embed_batch_fn(fact_texts)
+        with self.db.transaction():
+            for fact_text, vec, fact_type in zip(fact_texts, vecs, fact_types):
+                self.db.upsert_fact(
+                    fact_text, vec, self.config.duplicate_distance_threshold,
+                    source="extraction", fact_type=fact_type,
+                )
 
-        logger.info("Extracted %d facts from exchange", len(facts))
+        logger.info("Extracted %d facts from %d exchange(s)", len(facts), len(exchanges))
 
     @staticmethod
     def _parse_facts_json(raw: str) -> list[dict]:
-        """Best-effort parse of the LLM's JSON array output."""
-        text = raw.strip()
-        # Strip markdown fences if the LLM wrapped output
-        if text.startswith("```"):
-            lines = text.splitlines()
-            lines = [l for l in lines if not l.startswith("```")]
-            text = "\n".join(lines)
+        """Best-effort parse of the LLM's JSON array output.
+
+        Items are decoded one at a time, so commentary or a truncated object after
+        the last good fact only loses what follows it, not the whole array.
+        """
+        text = _FENCE_RE.sub("", raw.strip()).strip()
         try:
-            parsed = json.loads(text)
+            parsed = orjson.loads(text)
             if isinstance(parsed, list):
-                return parsed
-        except json.JSONDecodeError:
-            logger.warning("Could not parse fact-extraction JSON: %s", text[:200])
-        return []
-
-    def _deduplicate_and_insert(
-        self, fact_text: str, vec: list[float], fact_type: str
-    ) -> None:
-        """Check for near-duplicate facts; if found, delete old and insert new."""
-        existing = self.db.search_facts(vec, k=1)
-        if existing and existing[0].distance < self.config.duplicate_distance_threshold:
-            logger.debug(
-                "Replacing duplicate fact (dist=%.3f): '%s' → '%s'",
-                existing[0].distance, existing[0].content, fact_text,
-            )
-            self.db.delete_fact(existing[0].id)
+                return [item for item in parsed if isinstance(item, dict)]
+        except orjson.JSONDecodeError:
+            pass
 
-        self.db.insert_fact(fact_text, vec, source="extraction", fact_type=fact_type)
+        start = text.find("[")
+        if start < 0:
+            logger.warning("Could not parse fact-extraction JSON: %s", text[:200])
+            return []
+
+        facts: list[dict] = []
+        pos = start + 1
+        while True:
+            pos = _ITEM_SEP_RE.match(text, pos).end()
+            if pos >= len(text) or text[pos] == "]":
+                break
+            try:
+                item, pos = _JSON_DECODER.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                logger.warning(
+                    "Fact-extraction JSON malformed after %d item(s): %s",
+                    len(facts), text[pos:pos + 200],
+                )
+                break
+            if isinstance(item, dict):
+                facts.append(item)
+        return facts
 
     # --- Short-term cascade (conversation → summary) ---
 
-    def _check_short_term_cascade(self) -> None:
-        count = self.db.count_unsummarized()
+    def _check_short_term_cascade(self, count: int) -> bool:
+        """Summarize old messages once `count` reaches the threshold.
+
+        Returns True if a summary was written.
+        """
         if count < self.config.short_term_threshold:
-            return
+            return False
 
         logger.info("Short-term cascade triggered (%d unsummarized messages)", count)
         msgs = self.db.get_unsummarized_messages()
@@ -167,7 +281,7 @@ class MemoryManager:
         # Keep the most recent `short_term_keep` unsummarized
         to_summarize = msgs[: len(msgs) - self.config.short_term_keep]
         if not to_summarize:
-            return
+            return False
 
         # Format conversation block
         conv_text = "\n".join(
@@ -177,20 +291,22 @@ class MemoryManager:
         summary_messages = summarize_conversation_messages(conv_text)
         summary = self.chat_fn(summary_messages).strip()
 
-        self.db.insert_summary(
-            content=summary,
-            source_from_id=to_summarize[0].id,
-            source_to_id=to_summarize[-1].id,
-        )
-        self.db.mark_summarized(to_summarize[-1].id)
+        with self.db.transaction():
+            self.db.insert_summary(
+                content=summary,
+                source_from_id=to_summarize[0].id,
+                source_to_id=to_summarize[-1].id,
+            )
+            self.db.mark_summarized(to_summarize[-1].id)
         logger.info(
             "Summarized messages %d–%d", to_summarize[0].id, to_summarize[-1].id
         )
+        return True
 
     # --- Long-term cascade (summaries → base memory) ---
 
-    def _check_long_term_cascade(self) -> None:
-        count = self.db.count_unincorporated_summaries()
+    def _check_long_term_cascade(self, count: int) -> None:
+        """Fold old summaries into base memory once `count` reaches the threshold."""
         if count < self.config.long_term_threshold:
             return
 
@@ -209,8 +325,9 @@ class MemoryManager:
         recent_facts_text = ""
         try:
             # Use a generic query to pull some recent facts
-            vec = self.embed_fn("user information and preferences")
-            facts = self.db.search_facts(vec, k=10)
+            if self._generic_query_vec is None:
+                self._generic_query_vec = self.embed_fn(_GENERIC_FACTS_QUERY)
+            facts = self.db.search_facts(self._generic_query_vec, k=10)
             if facts:
                 recent_facts_text = "\n".join(f"- {f.content}" for f in facts)
         except Exception:
@@ -221,6 +338,7 @@ class MemoryManager:
         )
         new_base = self.chat_fn(distill_messages).strip()
 
-        self.db.set_base_memory(new_base)
-        self.db.mark_incorporated(to_incorporate[-1].id)
+        with self.db.transaction():
+            self.db.set_base_memory(new_base)
+            self.db.mark_incorporated(to_incorporate[-1].id)
         logger.info("Base memory updated, incorporated %d summaries", len(to_incorporate))
@@ -1,5 +1,52 @@
 """Prompt templates for fact extraction, summarization, and base-memory distillation."""
 
+from typing import Final
+
+# System prompts are fixed, so each background call sends a byte-identical prefix
+_FACT_EXTRACTION_SYSTEM: Final[str] = (
+    "You are a fact-extraction assistant. Given a conversation exchange "
+    "between a user and an assistant, extract any new facts worth remembering "
+    "about the user.\n\n"
+    "Rules:\n"
+    "- Output ONLY a JSON array. No commentary, no markdown fences.\n"
+    "- Each element: {\"fact\": \"...\", \"type\": \"...\"}\n"
+    "- Valid types: personal, preference, knowledge, event\n"
+    "- Write each fact as a standalone third-person sentence "
+    "(e.g. \"The user's name is Alex.\").\n"
+    "- Be selective: skip chitchat, greetings, filler. Only extract "
+    "things that would be useful to remember in future conversations.\n"
+    "- If there are no facts worth extracting, output an empty array: []"
+)
+_SUMMARIZE_SYSTEM: Final[str] = (
+    "You are a conversation summarizer. Condense the following "
+    "conversation into a 3-5 sentence paragraph.\n\n"
+    "Rules:\n"
+    "- Use third person, past tense.\n"
+    "- Preserve specific details: names, dates, numbers, decisions.\n"
+    "- Omit greetings, filler, and small talk.\n"
+    "- Output ONLY the summary paragraph, nothing else."
+)
+_DISTILL_SYSTEM: Final[str] = (
+    "You are a memory manager for a voice assistant called Lo-Bug. "
+    "Your job is to maintain a concise document that captures everything "
+    "important about the user.\n\n"
+    "You will receive:\n"
+    "1. The current base memory (may be empty on first run)\n"
+    "2. New conversation summaries\n"
+    "3. Recently extracted facts\n\n"
+    "Rules:\n"
+    "- Integrate the new information into the existing base memory.\n"
+    "- Organize into sections: User Profile, Preferences, "
+    "Ongoing Topics, Key History.\n"
+    "- Remove outdated or contradicted information.\n"
+    "- Keep the total document under 400 words.\n"
+    "- Output ONLY the updated base memory document, nothing else."
+)
+
+_FACT_EXTRACTION_MESSAGE: Final[dict] = {"role": "system", "content": _FACT_EXTRACTION_SYSTEM}
+_SUMMARIZE_MESSAGE: Final[dict] = {"role": "system", "content": _SUMMARIZE_SYSTEM}
+_DISTILL_MESSAGE: Final[dict] = {"role": "system", "content": _DISTILL_SYSTEM}
+
 
 def fact_extraction_messages(user_text: str, assistant_text: str) -> list[dict]:
     """Build messages that instruct the LLM to extract facts from one exchange.
@@ -7,31 +54,24 @@ def fact_extraction_messages(user_text: str, assistant_text: str) -> list[dict]:
     Returns a message list ready for llm.chat().
     The LLM should output a JSON array of {"fact": "...", "type": "..."}.
     """
+    return fact_extraction_batch_messages([(user_text, assistant_text)])
+
+
+def fact_extraction_batch_messages(exchanges: list[tuple[str, str]]) -> list[dict]:
+    """Build fact-extraction messages covering several (user, assistant) exchanges.
+
+    All exchanges go into one user message so a single LLM call extracts facts
+    from the whole batch.
+    """
+    exchanges_text = "\n\n".join(
+        f"User said: {user_text}\nAssistant said: {assistant_text}"
+        for user_text, assistant_text in exchanges
+    )
     return [
-        {
-            "role": "system",
-            "content": (
-                "You are a fact-extraction assistant. Given a conversation exchange "
-                "between a user and an assistant, extract any new facts worth remembering "
-                "about the user.\n\n"
-                "Rules:\n"
-                "- Output ONLY a JSON array. No commentary, no markdown fences.\n"
-                "- Each element: {\"fact\": \"...\", \"type\": \"...\"}\n"
-                "- Valid types: personal, preference, knowledge, event\n"
-                "- Write each fact as a standalone third-person sentence "
-                "(e.g. \"The user's name is Alex.\").\n"
-                "- Be selective: skip chitchat, greetings, filler. Only extract "
-                "things that would be useful to remember in future conversations.\n"
-                "- If there are no facts worth extracting, output an empty array: []"
-            ),
-        },
+        dict(_FACT_EXTRACTION_MESSAGE),
         {
             "role": "user",
-            "content": (
-                f"User said: {user_text}\n"
-                f"Assistant said: {assistant_text}\n\n"
-                "Extract facts as a JSON array."
-            ),
+            "content": f"{exchanges_text}\n\nExtract facts as a JSON array.",
         },
     ]
 
@@ -44,18 +84,7 @@ def summarize_conversation_messages(conversation_text: str) -> list[dict]:
         Assistant: ...
     """
     return [
-        {
-            "role": "system",
-            "content": (
-                "You are a conversation summarizer. Condense the following "
-                "conversation into a 3-5 sentence paragraph.\n\n"
-                "Rules:\n"
-                "- Use third person, past tense.\n"
-                "- Preserve specific details: names, dates, numbers, decisions.\n"
-                "- Omit greetings, filler, and small talk.\n"
-                "- Output ONLY the summary paragraph, nothing else."
-            ),
-        },
+        dict(_SUMMARIZE_MESSAGE),
         {
             "role": "user",
             "content": conversation_text,
@@ -71,25 +100,7 @@ def distill_base_memory_messages(
     The LLM should produce an updated base-memory document organized into sections.
     """
     return [
-        {
-            "role": "system",
-            "content": (
-                "You are a memory manager for a voice assistant called Lo-Bug. "
-                "Your job is to maintain a concise document that captures everything "
-                "important about the user.\n\n"
-                "You will receive:\n"
-                "1. The current base memory (may be empty on first run)\n"
-                "2. New conversation summaries\n"
-                "3. Recently extracted facts\n\n"
-                "Rules:\n"
-                "- Integrate the new information into the existing base memory.\n"
-                "- Organize into sections: User Profile, Preferences, "
-                "Ongoing Topics, Key History.\n"
-                "- Remove outdated or contradicted information.\n"
-                "- Keep the total document under 400 words.\n"
-                "- Output ONLY the updated base memory document, nothing else."
-            ),
-        },
+        dict(_DISTILL_MESSAGE),
         {
             "role": "user",
             "content": (
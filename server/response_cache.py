@@ -0,0 +1,105 @@
+"""Semantic cache of assistant replies, keyed by prompt prefix and query embedding."""
+
+import hashlib
+import logging
+import time
+
+from memory_config import MemoryConfig
+from memory_db import MemoryDB, serialize_vector
+
+logger = logging.getLogger(__name__)
+
+_SQL_LOOKUP = (
+    "SELECT vec_distance_cosine(query_embedding, ?) AS distance, response "
+    "FROM response_cache WHERE prefix_hash = ? AND created_at >= ? "
+    "ORDER BY distance LIMIT 1"
+)
+_SQL_INSERT = (
+    "INSERT INTO response_cache (prefix_hash, query_embedding, response, created_at) "
+    "VALUES (?, ?, ?, ?)"
+)
+
+
+class ResponseCache:
+    """Reuses a previous reply when a near-identical query arrives in the same context.
+
+    Entries are only comparable when the prompt prefix matches: every system message
+    (personality, memory, sensor state) plus the turn right before the new user
+    message, so a short follow-up like "yes" only hits after the same question.
+    Lives on the MemoryDB connection and uses sqlite-vec's cosine distance.
+    """
+
+    def __init__(self, db: MemoryDB, config: MemoryConfig | None = None):
+        self.db = db
+        self.config = config or db.config
+
+    def initialize(self) -> None:
+        """Create the cache table. Call after MemoryDB.initialize()."""
+        with self.db.transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    prefix_hash TEXT NOT NULL,
+                    query_embedding BLOB NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_response_prefix
+                ON response_cache (prefix_hash, created_at)
+            """)
+
+    @staticmethod
+    def prefix_hash(messages: list[dict]) -> str:
+        """Hash the parts of the prompt a cached reply depends on, besides the query."""
+        h = hashlib.blake2b(digest_size=16)
+        for msg in messages[:-1]:
+            if msg["role"] == "system":
+                h.update(msg["content"].encode())
+                h.update(b"\0")
+        if len(messages) >= 2 and messages[-2]["role"] != "system":
+            h.update(messages[-2]["role"].encode())
+            h.update(messages[-2]["content"].encode())
+        return h.hexdigest()
+
+    def lookup(self, messages: list[dict], query_vec: list[float] | None) -> str | None:
+        """Return a cached reply for a near-identical query in the same context, or None."""
+        if not self.config.response_cache_enabled or query_vec is None:
+            return None
+
+        try:
+            row = self.db.conn.execute(_SQL_LOOKUP, (
+                serialize_vector(query_vec),
+                self.prefix_hash(messages),
+                time.time() - self.config.response_cache_ttl,
+            )).fetchone()
+        except Exception as e:
+            logger.warning("Response cache lookup failed (non-fatal): %s", e)
+            return None
+
+        max_distance = 1.0 - self.config.response_cache_min_similarity
+        if row is None or row[0] > max_distance:
+            return None
+        logger.info("Response cache hit (dist=%.3f)", row[0])
+        return row[1]
+
+    def store(
+        self, messages: list[dict], query_vec: list[float] | None, response: str
+    ) -> None:
+        """Cache a reply and drop entries older than the TTL."""
+        if not self.config.response_cache_enabled or query_vec is None:
+            return
+
+        now = time.time()
+        try:
+            with self.db.transaction() as conn:
+                conn.execute(
+                    "DELETE FROM response_cache WHERE created_at < ?",
+                    (now - self.config.response_cache_ttl,),
+                )
+                conn.execute(_SQL_INSERT, (
+                    self.prefix_hash(messages), serialize_vector(query_vec), response, now,
+                ))
+        except Exception as e:
+            logger.warning("Response cache store failed (non-fatal): %s", e)
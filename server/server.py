@@ -1,22 +1,30 @@
 """FastAPI server for M5Stack Intelligent Agent."""
 
+import asyncio
 import base64
 import logging
 import time
-from contextlib import asynccontextmanager
-
-from fastapi import BackgroundTasks, FastAPI, UploadFile, File
-from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager, suppress
+from typing import Iterator
+from urllib.parse import quote
+
+import anyio
+import orjson
+from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
+from starlette.concurrency import iterate_in_threadpool
 
 import stt
 import llm
 import tts
-from conversation import ConversationManager
-from decision import heuristic_filter, parse_llm_response, Action
+from conversation import SYSTEM_PROMPT, ConversationManager
+from decision import heuristic_filter, Action
 from memory_config import MemoryConfig
 from memory_db import MemoryDB
 from memory_manager import MemoryManager
+from response_cache import ResponseCache
+from voice_reply import VoiceReply
 
 logging.basicConfig(
     level=logging.INFO,
@@ -27,35 +35,106 @@ logger = logging.getLogger(__name__)
 # Persistent memory subsystem (initialized in lifespan)
 memory_config = MemoryConfig()
 memory_db = MemoryDB(memory_config)
+response_cache = ResponseCache(memory_db, memory_config)
 memory_mgr: MemoryManager | None = None
 conversation: ConversationManager | None = None
 
+# Largest accepted upload: a minute of 16 kHz mono 16-bit PCM (the firmware sends <= 5 s)
+MAX_AUDIO_SECONDS = 60
+MAX_AUDIO_BYTES = stt.WAV_HEADER_SIZE + MAX_AUDIO_SECONDS * stt.SAMPLE_RATE * 2
+_UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Serializes chat turns: every turn reads and appends to the one shared conversation,
+# so a turn holds this from add_user_message until its reply is recorded
+turn_lock = asyncio.Lock()
+
+# Exchanges waiting for fact extraction and cascade checks
+CASCADE_QUEUE_SIZE = 32
+# How long shutdown waits for queued exchanges to be processed
+CASCADE_DRAIN_TIMEOUT = 30.0
+cascade_queue: asyncio.Queue[tuple[str, str]] | None = None
+
+
+async def _cascade_worker(queue: asyncio.Queue[tuple[str, str]]) -> None:
+    """Run memory processing off the request path, one batch at a time.
+
+    Exchanges that queued up while a batch was running are coalesced into the
+    next batch, so they share a single fact-extraction LLM call.
+    """
+    while True:
+        batch = [await queue.get()]
+        while not queue.empty():
+            batch.append(queue.get_nowait())
+        try:
+            await asyncio.to_thread(memory_mgr.process_exchanges, batch)
+        except Exception as e:
+            logger.error("Memory processing failed (non-fatal): %s", e)
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+
+def _queue_exchange(user_text: str, assistant_text: str) -> None:
+    """Hand an exchange to the cascade worker, dropping it if the queue is full."""
+    try:
+        cascade_queue.put_nowait((user_text, assistant_text))
+    except asyncio.QueueFull:
+        logger.warning("Memory queue full, dropping exchange: '%s'", user_text[:80])
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize models and memory system on startup."""
-    global memory_mgr, conversation
+    global memory_mgr, conversation, cascade_queue
 
     logger.info("Starting M5Stack Agent Server...")
-    stt.load_model("base")
     llm.configure("llama3.2:3b")
     llm.configure_embeddings(memory_config.embedding_model)
-    tts.load_model()
 
-    if not llm.check_available():
+    # Model loads, the Ollama probe, and opening the DB are independent; overlap them
+    _, _, ollama_ok, _ = await asyncio.gather(
+        asyncio.to_thread(stt.load_model, "base"),
+        asyncio.to_thread(tts.load_model),
+        asyncio.to_thread(llm.check_available),
+        asyncio.to_thread(memory_db.initialize),
+    )
+    if not ollama_ok:
         logger.warning("Ollama not available! Make sure 'ollama serve' is running.")
 
     # Initialize persistent memory
-    memory_db.initialize()
+    response_cache.initialize()
+    llm.configure_embedding_store(memory_db)
     memory_mgr = MemoryManager(
-        db=memory_db, embed_fn=llm.embed, chat_fn=llm.chat, config=memory_config
+        db=memory_db, embed_fn=llm.embed, chat_fn=llm.chat, config=memory_config,
+        embed_batch_fn=llm.embed_batch,
     )
+    # Needs Ollama; without it the old facts are kept and re-embedded on a later start
+    if ollama_ok:
+        memory_mgr.reembed_stale_facts()
     conversation = ConversationManager(memory_manager=memory_mgr)
     conversation.reload_from_db(memory_db)
 
+    # Prefill the static system prompt so the first turn hits a warm cache
+    if ollama_ok:
+        llm.warmup(SYSTEM_PROMPT)
+
+    cascade_queue = asyncio.Queue(maxsize=CASCADE_QUEUE_SIZE)
+    worker = asyncio.create_task(_cascade_worker(cascade_queue))
+
     logger.info("Server ready.")
     yield
     logger.info("Server shutting down.")
+    # Let queued exchanges finish fact extraction before the worker goes away
+    try:
+        await asyncio.wait_for(cascade_queue.join(), timeout=CASCADE_DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(
+            "Memory queue not drained after %.0fs, dropping %d exchanges",
+            CASCADE_DRAIN_TIMEOUT, cascade_queue.qsize(),
+        )
+    worker.cancel()
+    with suppress(asyncio.CancelledError):
+        await worker
 
 
 app = FastAPI(title="M5Stack Agent Server", lifespan=lifespan)
@@ -65,6 +144,7 @@ app = FastAPI(title="M5Stack Agent Server", lifespan=lifespan)
 
 class TextRequest(BaseModel):
     text: str
+    no_cache: bool = False  # sensitive prompt: never served from or stored in the response cache
 
 class TextResponse(BaseModel):
     response: str
@@ -88,110 +168,240 @@ class SensorData(BaseModel):
     gyro_z: float = 0.0
 
 
-# --- Endpoints ---
+def _reply_chunks(messages: list[dict], no_cache: bool = False) -> Iterator[str]:
+    """Stream the LLM reply for the current turn, served from the response cache when possible.
 
-@app.get("/health")
-async def health():
-    """Health check for M5Stack connection verification."""
-    ollama_ok = llm.check_available()
-    return {
-        "status": "ok",
-        "ollama": ollama_ok,
-        "timestamp": time.time(),
-    }
+    With no_cache the response cache is neither read nor written.
+    """
+    # Reuses the query embedding computed for memory retrieval in build_messages()
+    query_vec = None if no_cache else conversation.last_query_vec()
+    cached = response_cache.lookup(messages, query_vec)
+    if cached is not None:
+        yield cached
+        return
 
+    parts: list[str] = []
+    stream = llm.chat_stream(messages)
+    for chunk in stream:
+        parts.append(chunk)
+        yield chunk
 
-@app.post("/chat/text", response_model=TextResponse)
-async def chat_text(req: TextRequest, background_tasks: BackgroundTasks):
-    """Text chat: accept text, return LLM response."""
-    logger.info("Text chat: '%s'", req.text)
+    response_text = "".join(parts).strip()
+    logger.info("LLM response (%d chars): %s...", len(response_text), response_text[:80])
+    # Truncated replies and fallback apologies never complete, so they are not cached
+    if stream.complete:
+        response_cache.store(messages, query_vec, response_text)
 
-    conversation.add_user_message(req.text)
-    memory_db.append_message("user", req.text)
 
-    messages = conversation.build_messages()
-    response_text = llm.chat(messages)
+def _chat(messages: list[dict], no_cache: bool = False) -> str:
+    """Get the full LLM reply for the current turn."""
+    return "".join(_reply_chunks(messages, no_cache)).strip()
 
-    conversation.add_assistant_message(response_text)
-    memory_db.append_message("assistant", response_text)
 
-    # Background: extract facts and run cascade checks
-    background_tasks.add_task(memory_mgr.process_exchange, req.text, response_text)
+async def _read_audio(audio: UploadFile) -> bytearray:
+    """Read an uploaded WAV in chunks into a single buffer.
 
-    return TextResponse(response=response_text)
+    Oversized uploads are rejected with 413 as soon as they pass MAX_AUDIO_BYTES,
+    without buffering the rest.
+    """
+    if audio.size is not None and audio.size > MAX_AUDIO_BYTES:
+        raise HTTPException(status_code=413, detail="Audio upload too large")
 
+    buf = bytearray()
+    while chunk := await audio.read(_UPLOAD_CHUNK_SIZE):
+        buf += chunk
+        if len(buf) > MAX_AUDIO_BYTES:
+            raise HTTPException(status_code=413, detail="Audio upload too large")
+    return buf
 
-@app.post("/chat/audio", response_model=AudioResponse)
-async def chat_audio(
-    audio: UploadFile = File(...),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
-):
-    """Voice chat: accept WAV audio, return transcription + response + TTS audio."""
-    audio_bytes = await audio.read()
-    logger.info("Audio chat: received %d bytes", len(audio_bytes))
 
+def _screen_audio(audio_bytes: bytes) -> tuple[str, bool]:
+    """Transcribe an upload and run the heuristic pre-filter.
+
+    Returns (transcription, accepted). Rejected audio never reaches the LLM or the
+    conversation history.
+    """
     # Speech to text (returns rich metadata)
     result = stt.transcribe(audio_bytes)
 
     # Empty transcription → silent ignore (no "I couldn't hear anything")
     if not result.text:
         logger.info("Empty transcription, ignoring silently")
-        return AudioResponse(
-            transcription="", response="", action="ignore", audio_b64="",
-        )
+        return "", False
 
     # Heuristic pre-filter (no LLM call, no conversation history pollution)
     filter_reason = heuristic_filter(result)
     if filter_reason:
         logger.info("Heuristic filtered ('%s'): %s", result.text, filter_reason)
-        return AudioResponse(
-            transcription=result.text, response="", action="ignore", audio_b64="",
-        )
+        return result.text, False
 
-    # Passed filters → add to conversation and get LLM response
-    conversation.add_user_message(result.text)
-    memory_db.append_message("user", result.text)
+    return result.text, True
 
-    messages = conversation.build_messages()
-    raw_response = llm.chat(messages)
 
-    # Parse LLM action prefix
-    action, cleaned_text = parse_llm_response(raw_response)
+def _start_voice_turn(transcription: str) -> VoiceReply:
+    """Record the user's turn and start streaming the reply."""
+    conversation.add_user_message(transcription)
+    memory_db.append_message("user", transcription)
+    return VoiceReply(_reply_chunks(conversation.build_messages()))
 
+
+def _finish_voice_turn(transcription: str, reply: VoiceReply) -> None:
+    """Record the reply once it has been fully consumed."""
     # Store in conversation history (LLM decisions are context, even ignores)
-    conversation.add_assistant_message(raw_response)
-    memory_db.append_message("assistant", raw_response)
+    conversation.add_assistant_message(reply.raw_text)
+    memory_db.append_message("assistant", reply.raw_text)
 
     # Background: extract facts for non-IGNORE actions
-    if action != Action.IGNORE:
-        background_tasks.add_task(
-            memory_mgr.process_exchange, result.text, cleaned_text
-        )
+    if reply.action != Action.IGNORE:
+        _queue_exchange(transcription, reply.cleaned_text)
 
-    if action == Action.IGNORE:
-        logger.info("LLM chose to ignore: '%s'", result.text)
-        return AudioResponse(
-            transcription=result.text, response=cleaned_text,
-            action="ignore", audio_b64="",
-        )
+    if reply.action == Action.IGNORE:
+        logger.info("LLM chose to ignore: '%s'", transcription)
+    elif reply.action == Action.REACT:
+        logger.info("LLM chose react-only: '%s'", reply.cleaned_text)
+
+
+async def _voice_turn(audio_bytes: bytes) -> tuple[str, VoiceReply | None, bytes]:
+    """Run a full voice turn: screen, reply, and synthesize.
+
+    Returns (transcription, reply, wav). reply is None when the audio was filtered;
+    wav is empty unless the reply is spoken.
+    """
+    transcription, accepted = await asyncio.to_thread(_screen_audio, audio_bytes)
+    if not accepted:
+        return transcription, None, b""
+
+    # Passed filters → speech for each sentence is synthesized as the LLM streams it
+    async with turn_lock:
+        reply = await asyncio.to_thread(_start_voice_turn, transcription)
+        clips = [clip for _, clip in await asyncio.to_thread(list, reply)]
+        _finish_voice_turn(transcription, reply)
+
+    wav = tts.concat_wavs(clips) if reply.action == Action.RESPOND else b""
+    return transcription, reply, wav
 
-    if action == Action.REACT:
-        logger.info("LLM chose react-only: '%s'", cleaned_text)
+
+def _ndjson(event: dict) -> bytes:
+    return orjson.dumps(event, option=orjson.OPT_APPEND_NEWLINE)
+
+
+# --- Endpoints ---
+
+@app.get("/health")
+async def health():
+    """Health check for M5Stack connection verification."""
+    ollama_ok = await asyncio.to_thread(llm.check_available)
+    return {
+        "status": "ok",
+        "ollama": ollama_ok,
+        "timestamp": time.time(),
+    }
+
+
+@app.post("/chat/text", response_model=TextResponse)
+async def chat_text(req: TextRequest):
+    """Text chat: accept text, return LLM response."""
+    logger.info("Text chat: '%s'", req.text)
+
+    async with turn_lock:
+        conversation.add_user_message(req.text)
+        memory_db.append_message("user", req.text)
+
+        # Retrieval (embedding) and generation block; keep them off the event loop
+        messages = await asyncio.to_thread(conversation.build_messages)
+        response_text = await asyncio.to_thread(_chat, messages, req.no_cache)
+
+        conversation.add_assistant_message(response_text)
+        memory_db.append_message("assistant", response_text)
+
+    # Background: extract facts and run cascade checks
+    _queue_exchange(req.text, response_text)
+
+    return TextResponse(response=response_text)
+
+
+@app.post("/chat/audio", response_model=AudioResponse)
+async def chat_audio(audio: UploadFile = File(...)):
+    """Voice chat: accept WAV audio, return transcription + response + TTS audio."""
+    audio_bytes = await _read_audio(audio)
+    logger.info("Audio chat: received %d bytes", len(audio_bytes))
+
+    transcription, reply, wav = await _voice_turn(audio_bytes)
+    if reply is None:
         return AudioResponse(
-            transcription=result.text, response=cleaned_text,
-            action="react", audio_b64="",
+            transcription=transcription, response="", action="ignore", audio_b64="",
         )
 
-    # Normal response → synthesize speech
-    audio_response = tts.synthesize(cleaned_text)
-    audio_b64 = base64.b64encode(audio_response).decode()
-
     return AudioResponse(
-        transcription=result.text, response=cleaned_text,
-        action="respond", audio_b64=audio_b64,
+        transcription=transcription, response=reply.cleaned_text,
+        action=reply.action.value, audio_b64=base64.b64encode(wav).decode() if wav else "",
     )
 
 
+@app.post("/chat/audio/binary")
+async def chat_audio_binary(audio: UploadFile = File(...)):
+    """Voice chat with the reply as a raw WAV body instead of base64 in JSON.
+
+    Transcription, response text, and action travel in X-Transcription, X-Response,
+    and X-Action headers (percent-encoded UTF-8). Replies without speech return 204.
+    """
+    audio_bytes = await _read_audio(audio)
+    logger.info("Audio binary chat: received %d bytes", len(audio_bytes))
+
+    transcription, reply, wav = await _voice_turn(audio_bytes)
+    headers = {
+        "X-Transcription": quote(transcription),
+        "X-Response": quote(reply.cleaned_text if reply else ""),
+        "X-Action": reply.action.value if reply else "ignore",
+    }
+    if not wav:
+        return Response(status_code=204, headers=headers)
+    return Response(content=wav, media_type="audio/wav", headers=headers)
+
+
+@app.post("/chat/audio/stream")
+async def chat_audio_stream(audio: UploadFile = File(...)):
+    """Voice chat, streamed as NDJSON.
+
+    Emits {"partial_text", "partial_audio_b64"} for each spoken sentence as soon as
+    it is synthesized, then a final {"transcription", "response", "action", "done"}.
+    """
+    audio_bytes = await _read_audio(audio)
+    logger.info("Audio stream chat: received %d bytes", len(audio_bytes))
+
+    transcription, accepted = await asyncio.to_thread(_screen_audio, audio_bytes)
+
+    async def events():
+        if not accepted:
+            final = {"transcription": transcription, "response": "", "action": "ignore"}
+        else:
+            # Held until the reply is recorded, including while partials are sent
+            async with turn_lock:
+                reply = await asyncio.to_thread(_start_voice_turn, transcription)
+                sentences = iter(reply)
+                try:
+                    async for sentence, clip in iterate_in_threadpool(sentences):
+                        yield _ndjson({
+                            "partial_text": sentence,
+                            "partial_audio_b64": base64.b64encode(clip).decode(),
+                        })
+                finally:
+                    # Runs even if the client disconnects mid-stream: stop generating
+                    # and record the partial reply, so history never holds an
+                    # unanswered user turn. Shielded from the disconnect cancellation.
+                    with anyio.CancelScope(shield=True):
+                        await asyncio.to_thread(sentences.close)
+                    _finish_voice_turn(transcription, reply)
+            final = {
+                "transcription": transcription,
+                "response": reply.cleaned_text,
+                "action": reply.action.value,
+            }
+        yield _ndjson({**final, "done": True})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
 @app.post("/context/sensors")
 async def update_sensors(data: SensorData):
     """Update sensor context for the LLM."""
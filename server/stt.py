@@ -1,6 +1,8 @@
 """Speech-to-text using faster-whisper."""
 
 import logging
+import os
+import struct
 from dataclasses import dataclass
 
 import numpy as np
@@ -10,6 +12,23 @@ logger = logging.getLogger(__name__)
 
 _model: WhisperModel | None = None
 
+WAV_HEADER_SIZE = 44  # canonical header, assumed when the RIFF chunks can't be walked
+_PCM_SCALE = np.float32(1.0 / 32768.0)
+SAMPLE_RATE = 16000
+
+# Clips whose loudest 30 ms frame is quieter than this never reach Whisper. Judged
+# per frame, not over the whole clip, so leading/trailing silence cannot mask speech.
+SILENCE_DBFS = -40.0
+_SILENCE_RMS = 10 ** (SILENCE_DBFS / 20)
+_SILENCE_FRAME = SAMPLE_RATE * 30 // 1000
+# Clips shorter than this are decoded greedily; short commands gain little from beam search
+SHORT_CLIP_SECONDS = 2.0
+_VAD_PARAMETERS = {"min_silence_duration_ms": 500}
+
+# Whisper gets half the cores on larger machines, never fewer than CTranslate2's
+# default of 4; the rest stay free for TTS and the embedding/LLM calls that overlap
+DEFAULT_CPU_THREADS = max(4, (os.cpu_count() or 8) // 2)
+
 
 @dataclass
 class TranscriptionResult:
@@ -20,14 +39,46 @@ class TranscriptionResult:
     segment_count: int
 
 
-def load_model(model_size: str = "base") -> None:
+def load_model(model_size: str = "base", cpu_threads: int = DEFAULT_CPU_THREADS) -> None:
     """Load the Whisper model. Call once at startup."""
     global _model
-    logger.info("Loading Whisper model: %s", model_size)
-    _model = WhisperModel(model_size, device="cpu", compute_type="int8")
+    logger.info("Loading Whisper model: %s (%d threads)", model_size, cpu_threads)
+    _model = WhisperModel(
+        model_size, device="cpu", compute_type="int8", cpu_threads=cpu_threads,
+    )
     logger.info("Whisper model loaded")
 
 
+def _pcm_payload(audio_bytes: bytes) -> memoryview:
+    """Return the PCM samples of a WAV file, located via its 'data' chunk.
+
+    Skips any LIST/fact/etc. chunks before the data instead of assuming a 44-byte header.
+    """
+    view = memoryview(audio_bytes)
+    if audio_bytes[:4] == b"RIFF" and audio_bytes[8:12] == b"WAVE":
+        offset = 12
+        while offset + 8 <= len(audio_bytes):
+            chunk_id, chunk_size = struct.unpack_from("<4sI", audio_bytes, offset)
+            offset += 8
+            if chunk_id == b"data":
+                # Streaming writers may leave the size as 0; take the rest of the file
+                end = offset + chunk_size if chunk_size else len(audio_bytes)
+                pcm = view[offset:min(end, len(audio_bytes))]
+                return pcm[:len(pcm) & ~1]  # whole int16 samples only
+            offset += chunk_size + (chunk_size & 1)  # chunks are word-aligned
+    pcm = view[WAV_HEADER_SIZE:]
+    return pcm[:len(pcm) & ~1]
+
+
+def _peak_frame_rms(samples: np.ndarray) -> float:
+    """RMS of the loudest _SILENCE_FRAME-sample frame (the whole clip if shorter)."""
+    n_frames = len(samples) // _SILENCE_FRAME
+    if n_frames == 0:
+        return float(np.sqrt(np.mean(samples * samples)))
+    frames = samples[:n_frames * _SILENCE_FRAME].reshape(n_frames, _SILENCE_FRAME)
+    return float(np.sqrt(np.einsum("ij,ij->i", frames, frames).max() / _SILENCE_FRAME))
+
+
 def transcribe(audio_bytes: bytes) -> TranscriptionResult:
     """Transcribe WAV audio bytes to text.
 
@@ -43,17 +94,31 @@ def transcribe(audio_bytes: bytes) -> TranscriptionResult:
     if _model is None:
         raise RuntimeError("Whisper model not loaded. Call load_model() first.")
 
-    # Parse WAV: skip 44-byte header, read 16-bit PCM samples
-    if len(audio_bytes) < 44:
+    # Parse WAV: find the data chunk, read 16-bit PCM samples
+    if len(audio_bytes) < WAV_HEADER_SIZE:
         return empty
 
-    pcm_data = audio_bytes[44:]
+    pcm_data = _pcm_payload(audio_bytes)
     if len(pcm_data) == 0:
         return empty
 
-    samples = np.frombuffer(pcm_data, dtype=np.int16).astype(np.float32) / 32768.0
+    # Cast and scale in one pass, without an intermediate float array
+    samples = np.multiply(np.frombuffer(pcm_data, dtype=np.int16), _PCM_SCALE,
+                          dtype=np.float32)
 
-    segments_gen, info = _model.transcribe(samples, beam_size=5, language="en")
+    duration = len(samples) / SAMPLE_RATE
+    rms = _peak_frame_rms(samples)
+    if rms < _SILENCE_RMS:
+        logger.info("Skipped transcription: near-silent clip (%.1fs, peak rms=%.4f)",
+                    duration, rms)
+        empty.audio_duration = duration
+        return empty
+
+    beam_size = 1 if duration < SHORT_CLIP_SECONDS else 5
+    segments_gen, info = _model.transcribe(
+        samples, beam_size=beam_size, language="en",
+        vad_filter=True, vad_parameters=_VAD_PARAMETERS,
+    )
 
     # Collect segments in one pass
     segments = list(segments_gen)
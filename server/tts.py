@@ -41,30 +41,21 @@ def synthesize(text: str, sample_rate: int = 16000) -> bytes:
 def _synthesize_say(text: str, sample_rate: int) -> bytes:
     """Use macOS 'say' command for TTS."""
     try:
-        with tempfile.NamedTemporaryFile(suffix=".aiff", delete=False) as tmp:
-            tmp_path = tmp.name
-
-        # Generate speech with 'say' -> AIFF file
-        subprocess.run(
-            ["say", "-o", tmp_path, text],
-            capture_output=True,
-            timeout=30,
-        )
-
-        # Convert AIFF to WAV using afconvert
-        wav_path = tmp_path + ".wav"
-        subprocess.run(
-            ["afconvert", "-f", "WAVE", "-d", f"LEI16@{sample_rate}",
-             tmp_path, wav_path],
-            capture_output=True,
-            timeout=10,
-        )
-
-        wav_bytes = Path(wav_path).read_bytes()
-
-        # Clean up temp files
-        Path(tmp_path).unlink(missing_ok=True)
-        Path(wav_path).unlink(missing_ok=True)
+        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
+            wav_path = tmp.name
+
+        # Generate 16-bit PCM WAV directly with 'say' (no afconvert pass);
+        # say needs a seekable file to finalize the header, so no stdout pipe
+        try:
+            subprocess.run(
+                ["say", "--file-format=WAVE", f"--data-format=LEI16@{sample_rate}",
+                 "-o", wav_path, text],
+                capture_output=True,
+                timeout=30,
+            )
+            wav_bytes = Path(wav_path).read_bytes()
+        finally:
+            Path(wav_path).unlink(missing_ok=True)
 
         if len(wav_bytes) > 44:
             logger.info("TTS (say): generated %d bytes", len(wav_bytes))
@@ -78,6 +69,17 @@ def _synthesize_say(text: str, sample_rate: int) -> bytes:
 
 
 
+def concat_wavs(wavs: list[bytes], sample_rate: int = 16000) -> bytes:
+    """Join WAV clips (e.g. one per sentence) into a single WAV."""
+    if not wavs:
+        return _empty_wav(sample_rate)
+    pcm = []
+    for wav_bytes in wavs:
+        with wave.open(io.BytesIO(wav_bytes), "rb") as wf:
+            pcm.append(wf.readframes(wf.getnframes()))
+    return _raw_to_wav(b"".join(pcm), sample_rate)
+
+
 def _raw_to_wav(raw_pcm: bytes, sample_rate: int) -> bytes:
     """Wrap raw 16-bit mono PCM in a WAV header."""
     buf = io.BytesIO()
@@ -0,0 +1,91 @@
+"""Incremental voice replies: synthesize speech sentence by sentence while the LLM streams."""
+
+import itertools
+import logging
+import re
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Iterator
+
+import tts
+from decision import Action, detect_action, parse_llm_response
+
+logger = logging.getLogger(__name__)
+
+# Whitespace after sentence-ending punctuation marks a point where TTS can start
+_SENTENCE_BREAK_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def iter_sentences(chunks: Iterable[str]) -> Iterator[str]:
+    """Regroup streamed text chunks into complete sentences."""
+    buf = ""
+    for chunk in chunks:
+        buf += chunk
+        *complete, buf = _SENTENCE_BREAK_RE.split(buf)
+        for sentence in complete:
+            if sentence.strip():
+                yield sentence.strip()
+    if buf.strip():
+        yield buf.strip()
+
+
+class VoiceReply:
+    """A streamed LLM reply for a voice turn.
+
+    Iterating yields (sentence, wav_bytes) for spoken replies; each sentence is
+    synthesized while the LLM keeps generating the next. IGNORE and REACT replies
+    yield nothing. Once iteration finishes, action, raw_text and cleaned_text hold
+    the parsed result; if it is closed early, they hold the part generated so far.
+    """
+
+    def __init__(self, chunks: Iterable[str]):
+        self._chunks = iter(chunks)
+        self.action = Action.RESPOND
+        self.raw_text = ""
+        self.cleaned_text = ""
+
+    def __iter__(self) -> Iterator[tuple[str, bytes]]:
+        parts: list[str] = []
+
+        try:
+            # Read just far enough to know whether the reply is spoken at all
+            action = None
+            for chunk in self._chunks:
+                parts.append(chunk)
+                action = detect_action("".join(parts))
+                if action is not None:
+                    break
+
+            if action in (Action.IGNORE, Action.REACT):
+                parts.extend(self._chunks)
+            else:
+                rest = self._collect(self._chunks, parts)
+                yield from self._speak(itertools.chain(["".join(parts)], rest))
+        finally:
+            # Also runs when iteration is closed early: stop the LLM stream and keep
+            # whatever part of the reply was generated
+            close = getattr(self._chunks, "close", None)
+            if close is not None:
+                close()
+            self.raw_text = "".join(parts).strip()
+            self.action, self.cleaned_text = parse_llm_response(self.raw_text)
+
+    @staticmethod
+    def _collect(chunks: Iterator[str], parts: list[str]) -> Iterator[str]:
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+
+    @staticmethod
+    def _speak(chunks: Iterable[str]) -> Iterator[tuple[str, bytes]]:
+        # One TTS worker keeps the clips in order while the LLM stream is read here
+        pending: deque[tuple[str, Future]] = deque()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts") as pool:
+            for sentence in iter_sentences(chunks):
+                pending.append((sentence, pool.submit(tts.synthesize, sentence)))
+                while pending and pending[0][1].done():
+                    sentence, clip = pending.popleft()
+                    yield sentence, clip.result()
+            while pending:
+                sentence, clip = pending.popleft()
+                yield sentence, clip.result()